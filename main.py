@@ -1,26 +1,143 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse
-import base64
+from fastapi import FastAPI, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import mmap
+import orjson
 import os
-from datetime import datetime
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from typing import Optional, Union
+
+# Prefer the SIMD-accelerated codec; the stdlib one is API-compatible
+try:
+    from pybase64 import b64decode, b64encode
+except ImportError:
+    from base64 import b64decode, b64encode
 
 # === Create FastAPI app ===
 app = FastAPI()
+# Base64 text compresses well; level 1 keeps the CPU cost low
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=1)
 
 # === Configuration ===
 UPLOAD_DIR = "latest"
 LOG_FILE = "logs.txt"
 LATEST_FILE = os.path.join(UPLOAD_DIR, "latest.png")
+# Ready-made /get-latest-image response body, rebuilt on every upload
+LATEST_JSON = os.path.join(UPLOAD_DIR, "latest.json")
 
 # Create the upload folder if it doesn't exist
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Serializes publishing latest.png and latest.json as a pair
+_LATEST_LOCK = threading.Lock()
+# Set by uploads; endpoints that find the file gone reset it via _forget_image
+_IMAGE_EXISTS = os.path.exists(LATEST_FILE)
+
 # === Logging helper ===
+# Kept open for the process lifetime; line buffering flushes each entry
+_LOG_FH = open(LOG_FILE, "a", buffering=1)
+_LOG_LOCK = threading.Lock()
+
 def log_event(message: str):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(LOG_FILE, "a") as f:
-        f.write(f"[{timestamp}] {message}\n")
-    print(f"[{timestamp}] {message}")
+    line = f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}"
+    with _LOG_LOCK:
+        _LOG_FH.write(line + "\n")
+    print(line)
+
+# === Encoding helpers ===
+def _encode_file(path: str) -> bytes:
+    """
+    Base64-encodes a file straight from a read-only memory map,
+    avoiding an intermediate copy of the file contents.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return b64encode(mm)
+
+def _latest_json(encoded: bytes) -> bytes:
+    """
+    Builds the /get-latest-image response body around a base64 payload.
+    """
+    return b'{"status":"ok","filename":"latest.png","image_base64":"' + encoded + b'"}'
+
+# === Streaming helper ===
+def _stream_file(f, st: os.stat_result, media_type: str, headers: Optional[dict] = None) -> StreamingResponse:
+    """
+    Streams exactly st.st_size bytes from an already-open file.
+    The fd stays on its inode even if the path is os.replace()d or
+    appended to mid-transfer, so Content-Length always matches the body.
+    """
+    def read_file():
+        with f:
+            remaining = st.st_size
+            while remaining:
+                chunk = f.read(min(65536, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    return StreamingResponse(
+        read_file(),
+        media_type=media_type,
+        headers={**(headers or {}), "Content-Length": str(st.st_size)}
+    )
+
+# === Atomic write helpers ===
+def _mkstemp():
+    """
+    Creates a temp file in UPLOAD_DIR with the same 0644 mode a plain
+    open() would give, since mkstemp's 0600 survives os.replace.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".tmp")
+    os.fchmod(fd, 0o644)
+    return fd, tmp_path
+
+def _write_tmp(data: Union[bytes, memoryview]) -> str:
+    """
+    Writes data to a fresh temp file in UPLOAD_DIR with raw os.write calls
+    and returns its path, ready to be os.replace()d into place.
+    """
+    fd, tmp_path = _mkstemp()
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    except BaseException:
+        os.close(fd)
+        os.remove(tmp_path)
+        raise
+    os.close(fd)
+    return tmp_path
+
+def _discard(*paths: Optional[str]):
+    """
+    Removes leftover temp files after a failed upload, skipping paths
+    that were never created or have already been os.replace()d away.
+    """
+    for path in paths:
+        if path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def _forget_image():
+    """
+    Called when latest.png turns out to be gone: clears the availability
+    flag and drops latest.json with it, so no endpoint serves a stale copy.
+    """
+    global _IMAGE_EXISTS
+    with _LATEST_LOCK:
+        # An upload may have republished the pair since the caller looked
+        if not os.path.exists(LATEST_FILE):
+            _IMAGE_EXISTS = False
+            _discard(LATEST_JSON)
 
 # === Endpoint: receive image from Jetson ===
 @app.post("/upload")
@@ -29,19 +146,58 @@ async def receive_image(request: Request):
     Receives a base64-encoded image from Jetson.
     Saves it as latest/latest.png
     """
+    global _IMAGE_EXISTS
+    png_tmp = json_tmp = None
     try:
-        data = await request.json()
+        data = orjson.loads(await request.body())
         image_b64 = data["image"]
         filename = data.get("filename", "latest.png")
-        image_bytes = base64.b64decode(image_b64)
-        with open(LATEST_FILE, "wb") as f:
-            f.write(image_bytes)
+        image_bytes: bytes = b64decode(image_b64)
+        # One buffer view shared by the disk write and the re-encode
+        view = memoryview(image_bytes)
+        png_tmp = _write_tmp(view)
+        json_tmp = _write_tmp(_latest_json(b64encode(view)))
+        with _LATEST_LOCK:
+            os.replace(png_tmp, LATEST_FILE)
+            os.replace(json_tmp, LATEST_JSON)
+            _IMAGE_EXISTS = True
         log_event(f"Image received and saved: {filename}")
         return {"status": "ok", "message": "Image successfully received"}
     except Exception as e:
+        _discard(png_tmp, json_tmp)
         log_event(f"Upload error: {e}")
         return {"status": "error", "message": str(e)}
 
+# === Endpoint: receive raw image bytes from Jetson ===
+@app.post("/upload-raw")
+async def receive_raw_image(request: Request):
+    """
+    Receives a PNG as the raw request body (no base64, no JSON).
+    Streams it to disk and publishes it as latest/latest.png
+    """
+    global _IMAGE_EXISTS
+    fd, png_tmp = _mkstemp()
+    json_tmp = None
+    try:
+        size = 0
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in request.stream():
+                f.write(chunk)
+                size += len(chunk)
+        if size == 0:
+            raise ValueError("Empty request body")
+        json_tmp = _write_tmp(_latest_json(_encode_file(png_tmp)))
+        with _LATEST_LOCK:
+            os.replace(png_tmp, LATEST_FILE)
+            os.replace(json_tmp, LATEST_JSON)
+            _IMAGE_EXISTS = True
+        log_event(f"Raw image received and saved: {size} bytes")
+        return {"status": "ok", "message": "Image successfully received"}
+    except Exception as e:
+        _discard(png_tmp, json_tmp)
+        log_event(f"Raw upload error: {e}")
+        return {"status": "error", "message": str(e)}
+
 # === Endpoint: health check ===
 @app.get("/check")
 def status():
@@ -50,7 +206,7 @@ def status():
     """
     return {
         "status": "running",
-        "image_available": os.path.exists(LATEST_FILE)
+        "image_available": _IMAGE_EXISTS
     }
 
 # === Endpoint: return latest image (base64) ===
@@ -58,39 +214,66 @@ def status():
 def get_latest_image():
     """
     Returns the latest image as a base64 string.
+    Serves the JSON body precomputed at upload time.
     """
-    if not os.path.exists(LATEST_FILE):
+    if not _IMAGE_EXISTS:
         return JSONResponse(status_code=404, content={"status": "error", "message": "No image available"})
 
-    with open(LATEST_FILE, "rb") as f:
-        encoded = base64.b64encode(f.read()).decode("utf-8")
+    try:
+        # latest.png is the source of truth; latest.json is derived from it
+        os.stat(LATEST_FILE)
+        try:
+            f = open(LATEST_JSON, "rb")
+        except FileNotFoundError:
+            # latest.png may predate latest.json (e.g. left by an older deploy)
+            with _LATEST_LOCK:
+                os.replace(_write_tmp(_latest_json(_encode_file(LATEST_FILE))), LATEST_JSON)
+            f = open(LATEST_JSON, "rb")
+    except FileNotFoundError:
+        _forget_image()
+        return JSONResponse(status_code=404, content={"status": "error", "message": "No image available"})
 
-    return {
-        "status": "ok",
-        "filename": "latest.png",
-        "image_base64": encoded
-    }
+    return _stream_file(f, os.fstat(f.fileno()), "application/json")
 
 # === Endpoint: view latest image (PNG) ===
 @app.get("/view-image")
-def view_image():
+def view_image(request: Request):
     """
     Returns the latest image as a raw PNG for browser viewing.
+    Answers 304 when the client already holds the current version.
     """
-    if os.path.exists(LATEST_FILE):
-        return FileResponse(LATEST_FILE, media_type="image/png")
-    return JSONResponse(status_code=404, content={"status": "error", "message": "No image available"})
+    try:
+        f = open(LATEST_FILE, "rb")
+    except FileNotFoundError:
+        _forget_image()
+        return JSONResponse(status_code=404, content={"status": "error", "message": "No image available"})
+
+    # Every upload os.replace()s in a new inode; size and mtime guard reuse
+    st = os.fstat(f.fileno())
+    etag = f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": "no-cache"
+    }
+    if request.headers.get("if-none-match") == etag:
+        f.close()
+        return Response(status_code=304, headers=headers)
+    return _stream_file(f, st, "image/png", headers)
 
 # === Endpoint: view logs ===
 @app.get("/view-logs")
 def view_logs():
     """
     Displays contents of logs.txt for monitoring.
+    Streams exactly the bytes present at request time, since log_event
+    keeps appending while the response is being sent.
     """
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "r") as f:
-            return PlainTextResponse(f.read())
-    return PlainTextResponse("No logs available.")
+    try:
+        f = open(LOG_FILE, "rb")
+    except FileNotFoundError:
+        return PlainTextResponse("No logs available.")
+    return _stream_file(f, os.fstat(f.fileno()), "text/plain; charset=utf-8")
 
 # === Endpoint: receive pong to avoid the API goes sleep ===
 @app.api_route("/ping", methods=["GET", "HEAD"])
@@ -105,15 +288,28 @@ async def ping(request: Request):
 async def receive_demand(request: Request):
     """
     Receives a request from Box-E.
-    If demand is true, returns the latest image in base64.
+    If demand is true, returns the latest image as a raw PNG.
     """
     try:
-        data = await request.json()
+        data = orjson.loads(await request.body())
         demand = data.get("demand", False)
         log_event(f"Box-E demand received: {'YES' if demand else 'NO'}")
         if demand:
-            return get_latest_image()
+            try:
+                f = open(LATEST_FILE, "rb")
+            except FileNotFoundError:
+                _forget_image()
+                return JSONResponse(status_code=404, content={"status": "error", "message": "No image available"})
+            return _stream_file(f, os.fstat(f.fileno()), "image/png")
         return {"status": "ok", "message": "Demand is false, no image sent"}
     except Exception as e:
         log_event(f"Error in /receive-demand: {e}")
         return {"status": "error", "message": str(e)}
+
+
+# === Local entry point (mirrors the Procfile) ===
+if __name__ == "__main__":
+    import uvicorn
+    # uvloop and httptools come with uvicorn[standard]; keep a single worker
+    # since image availability is tracked per process
+    uvicorn.run("main:app", host="0.0.0.0", port=10000, loop="uvloop", http="httptools")
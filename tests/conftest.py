@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def main_module(tmp_path_factory):
+    # main creates latest/ and opens logs.txt relative to the cwd on import
+    workdir = tmp_path_factory.mktemp("app")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import main
+    finally:
+        os.chdir(cwd)
+    return main
+
+
+@pytest.fixture
+def client(main_module, tmp_path, monkeypatch):
+    # Each test gets an empty latest/ of its own
+    monkeypatch.chdir(tmp_path)
+    os.mkdir(main_module.UPLOAD_DIR)
+    monkeypatch.setattr(main_module, "_IMAGE_EXISTS", False)
+    return TestClient(main_module.app)
@@ -0,0 +1,134 @@
+import asyncio
+import base64
+import errno
+import os
+
+import pytest
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 16
+
+
+def upload(client, data=PNG):
+    return client.post("/upload", json={"image": base64.b64encode(data).decode()})
+
+
+def temp_files(main_module):
+    return [name for name in os.listdir(main_module.UPLOAD_DIR) if name.endswith(".tmp")]
+
+
+def test_upload_then_get_latest_image(client, main_module):
+    assert upload(client).json()["status"] == "ok"
+
+    r = client.get("/get-latest-image")
+    assert r.status_code == 200
+    body = r.json()
+    assert body["status"] == "ok"
+    assert body["filename"] == "latest.png"
+    assert base64.b64decode(body["image_base64"]) == PNG
+    assert client.get("/check").json()["image_available"] is True
+    for path in (main_module.LATEST_FILE, main_module.LATEST_JSON):
+        assert os.stat(path).st_mode & 0o777 == 0o644
+
+
+def test_get_latest_image_without_upload(client):
+    assert client.get("/get-latest-image").status_code == 404
+    assert client.get("/check").json()["image_available"] is False
+
+
+def test_upload_raw_empty_body(client, main_module):
+    r = client.post("/upload-raw", content=b"")
+    assert r.json() == {"status": "error", "message": "Empty request body"}
+    assert temp_files(main_module) == []
+    assert client.get("/view-image").status_code == 404
+
+
+def test_upload_raw(client):
+    assert client.post("/upload-raw", content=PNG).json()["status"] == "ok"
+
+    assert client.get("/view-image").content == PNG
+    body = client.get("/get-latest-image").json()
+    assert base64.b64decode(body["image_base64"]) == PNG
+
+
+def test_view_image_not_modified(client):
+    upload(client)
+    r = client.get("/view-image")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "image/png"
+    assert r.headers["content-length"] == str(len(PNG))
+
+    r = client.get("/view-image", headers={"If-None-Match": r.headers["etag"]})
+    assert r.status_code == 304
+    assert r.content == b""
+
+
+def test_view_image_etag_changes_on_upload(client):
+    upload(client)
+    etag = client.get("/view-image").headers["etag"]
+    upload(client, PNG[::-1])
+    r = client.get("/view-image", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.content == PNG[::-1]
+
+
+def test_receive_demand(client):
+    upload(client)
+    r = client.post("/receive-demand", json={"demand": True})
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "image/png"
+    assert r.content == PNG
+
+    r = client.post("/receive-demand", json={"demand": False})
+    assert r.json()["status"] == "ok"
+
+
+def test_receive_demand_without_image(client):
+    assert client.post("/receive-demand", json={"demand": True}).status_code == 404
+
+
+@pytest.mark.parametrize("target", ["_latest_json", "replace"])
+def test_upload_failure_leaves_no_temp_files(client, main_module, monkeypatch, target):
+    def fail(*args, **kwargs):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    if target == "replace":
+        monkeypatch.setattr(main_module.os, "replace", fail)
+    else:
+        monkeypatch.setattr(main_module, target, fail)
+
+    assert upload(client).json()["status"] == "error"
+    assert temp_files(main_module) == []
+    assert not os.path.exists(main_module.LATEST_FILE)
+
+
+def test_vanished_image_returns_404(client, main_module):
+    upload(client)
+    os.remove(main_module.LATEST_FILE)
+
+    assert client.get("/get-latest-image").status_code == 404
+    assert client.get("/view-image").status_code == 404
+    assert client.post("/receive-demand", json={"demand": True}).status_code == 404
+    assert client.get("/check").json()["image_available"] is False
+    assert not os.path.exists(main_module.LATEST_JSON)
+
+
+def test_missing_json_is_rebuilt(client, main_module):
+    upload(client)
+    os.remove(main_module.LATEST_JSON)
+
+    body = client.get("/get-latest-image").json()
+    assert base64.b64decode(body["image_base64"]) == PNG
+
+
+def test_response_survives_concurrent_upload(client, main_module):
+    upload(client)
+    response = main_module.get_latest_image()
+    # A bigger image replaces latest.json before the response is sent
+    upload(client, PNG * 4)
+
+    async def drain():
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    body = asyncio.run(drain())
+    assert response.headers["content-length"] == str(len(body))
+    assert base64.b64decode(main_module.orjson.loads(body)["image_base64"]) == PNG